@@ -1,12 +1,21 @@
-from flask import Flask, request, jsonify, Response
+from flask import Flask, request, jsonify, Response, stream_with_context, copy_current_request_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from llm_generator import generate_manim_code, improve_prompt
+from llm_generator import generate_manim_code_async, improve_prompt_async, generate_manim_code_stream, generate_many, get_llm, trim_prompt, warm_chains
+import semantic_cache
+from semantic_cache import generate_cache, improve_cache
+from exact_cache import generate_exact, improve_exact
+import psutil
 import logging
+import json
+import queue
+import threading
+import itertools
+import asyncio
 import gc
 import time
-import threading
-import signal
 import os
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
 from functools import wraps
 
 # Setup logging
@@ -15,69 +24,220 @@ logging.basicConfig(level=logging.INFO,
                    handlers=[logging.StreamHandler()])
 logger = logging.getLogger(__name__)
 
-# Configure timeout for hanging requests
-TIMEOUT_SECONDS = 180
+# Interval between SSE keepalive comments while the LLM is still working;
+# ingresses commonly drop connections idle for 60-120s
+KEEPALIVE_SECONDS = 15
 
-def timeout_handler(signum, frame):
-    logger.error("Request processing timed out")
-    gc.collect()
-    raise TimeoutError("Request took too long to process")
+# Coalesce streamed tokens into ~MTU-sized SSE events before writing
+SSE_FLUSH_BYTES = int(os.environ.get('SSE_FLUSH_BYTES', '1400'))
 
-# Request timeout decorator
+# Configure timeout for hanging requests. Derived from the LLM client's
+# REQUEST_TIMEOUT with headroom so the socket-level timeout inside
+# llm_generator fires first and actually cancels the outbound call; this
+# deadline is just the last line of defense for the whole view.
+TIMEOUT_SECONDS = int(os.environ.get('REQUEST_TIMEOUT', '180')) + 10
+
+# Pool for running sync handlers with an enforceable deadline
+_timeout_pool = ThreadPoolExecutor(max_workers=32)
+
+# Request timeout decorator, safe under threaded/gevent workers
 def timeout_decorator(seconds):
     def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            # Async views get a native asyncio timeout
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                try:
+                    return await asyncio.wait_for(func(*args, **kwargs), timeout=seconds)
+                except asyncio.TimeoutError:
+                    logger.error("Request processing timed out")
+                    gc.collect()
+                    raise TimeoutError("Request took too long to process")
+            return async_wrapper
+
         @wraps(func)
         def wrapper(*args, **kwargs):
-            # Set the timeout handler
-            signal.signal(signal.SIGALRM, timeout_handler)
-            signal.alarm(seconds)
+            # SIGALRM only works on the main thread, so run the handler on
+            # the pool and wait with a deadline instead. Pool threads have
+            # no Flask context of their own, so carry this request's along.
+            future = _timeout_pool.submit(
+                copy_current_request_context(func), *args, **kwargs)
             try:
-                result = func(*args, **kwargs)
-                # Cancel the alarm if the function returns
-                signal.alarm(0)
-                return result
-            except Exception as e:
-                # Cancel the alarm if an exception is raised
-                signal.alarm(0)
-                raise e
+                return future.result(timeout=seconds)
+            except FuturesTimeout:
+                logger.error("Request processing timed out")
+                gc.collect()
+                raise TimeoutError("Request took too long to process")
         return wrapper
     return decorator
 
+# Collect far less often during the allocation bursts of LLM response parsing
+gc.set_threshold(20000, 10, 10)
+
 app = Flask(__name__)
+
+# Reject oversized bodies before the JSON is even parsed; prompts are
+# truncated to MAX_PROMPT_CHARS well below this anyway
+app.config['MAX_CONTENT_LENGTH'] = 1024 * 1024
+
+# Upper bound on prompts per /batch_generate call
+BATCH_MAX_PROMPTS = int(os.environ.get('BATCH_MAX_PROMPTS', '8'))
+
+# Serialize responses with orjson: multi-KB generated code dominates the
+# response path and orjson is several times faster than stdlib json
+try:
+    import orjson
+
+    class ORJSONProvider(DefaultJSONProvider):
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj).decode()
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+    app.json = ORJSONProvider(app)
+except ImportError:
+    logger.warning("orjson not installed, using stdlib json")
+    # At least skip the pretty-printing whitespace on the fallback path
+    app.json.compact = True
+
 # More permissive CORS configuration
 CORS(app, 
      resources={r"/*": {"origins": "*"}}, 
      supports_credentials=False,
      allow_headers=["Content-Type", "Authorization"],
-     methods=["GET", "POST", "OPTIONS"])
+     methods=["GET", "POST", "OPTIONS"],
+     automatic_options=True)
+
+
+@app.errorhandler(TimeoutError)
+def handle_timeout(e):
+    # The timeout wrapper raises after the view's own try/except has been
+    # left behind, so the 408 contract is honored here rather than
+    # falling through to Flask's generic 500
+    logger.error("Returning 408 for timed-out request: %s", str(e))
+    return jsonify({'error': 'Request timed out',
+                    'code': '// Error: The request took too long to process. Please try with a simpler prompt.'}), 408
+
 
-# Add request tracking for diagnostics
+# Add request tracking for diagnostics. next() on itertools.count is
+# atomic under the GIL; the active gauge needs a lock because += is not
+_req_ids = itertools.count(1)
+_counter_lock = threading.Lock()
 request_count = 0
 active_requests = 0
 
+# Optional Prometheus metrics; /metrics is exposed when the client
+# library is installed
+try:
+    from prometheus_client import Counter, Gauge, generate_latest, CONTENT_TYPE_LATEST
+    _PROM_REQUESTS = Counter('automanim_requests_total', 'Total API requests')
+    _PROM_ACTIVE = Gauge('automanim_active_requests', 'In-flight API requests')
+except ImportError:
+    _PROM_REQUESTS = _PROM_ACTIVE = None
+
+# Per-IP cooldown between LLM calls. Bounded and keyed by monotonic
+# timestamps so the map can't grow forever on a public endpoint
+COOLDOWN_SECONDS = float(os.getenv("COOLDOWN_SECONDS", "3"))
+RATE_LIMIT_MAX_ENTRIES = 100_000
+user_last_request = {}
+
+# The in-process map only sees one worker's traffic, so under N gunicorn
+# workers the cooldown is effectively COOLDOWN/N. When REDIS_URL is set,
+# share the state across workers with one atomic check-and-set round-trip
+_redis = None
+if os.getenv("REDIS_URL"):
+    try:
+        import redis
+        _redis = redis.Redis.from_url(os.getenv("REDIS_URL"), socket_timeout=1)
+    except Exception as e:
+        logger.warning("Redis rate limiter unavailable: %s", str(e))
+
+_COOLDOWN_LUA = ("if redis.call('SET', KEYS[1], 1, 'NX', 'EX', ARGV[1]) "
+                 "then return 0 else return redis.call('TTL', KEYS[1]) end")
+
+def cooldown_remaining(ip):
+    """Seconds left on the caller's cooldown, or 0 when the call may proceed"""
+    if _redis is not None:
+        try:
+            return int(_redis.eval(_COOLDOWN_LUA, 1, f"cd:{ip}", max(1, int(COOLDOWN_SECONDS))))
+        except Exception as e:
+            # Fall back to the per-process map if Redis is unreachable
+            logger.warning("Redis rate limit check failed: %s", str(e))
+    now = time.monotonic()
+    last = user_last_request.get(ip)
+    if last is not None and now - last < COOLDOWN_SECONDS:
+        return COOLDOWN_SECONDS - (now - last)
+    if len(user_last_request) >= RATE_LIMIT_MAX_ENTRIES:
+        # Drop entries whose cooldown has long expired before inserting
+        cutoff = now - COOLDOWN_SECONDS * 2
+        for key, seen in list(user_last_request.items()):
+            if seen < cutoff:
+                del user_last_request[key]
+    user_last_request[ip] = now
+    return 0
+
+# One process handle for the life of the worker; each memory_info() is a
+# /proc read, so sample it at most once a second
+_PROC = psutil.Process(os.getpid())
+_START_TIME = _PROC.create_time()
+_meminfo_sample = (0.0, None)
+
+def _meminfo():
+    global _meminfo_sample
+    now = time.monotonic()
+    sampled_at, info = _meminfo_sample
+    if info is None or now - sampled_at > 1.0:
+        info = _PROC.memory_info()
+        _meminfo_sample = (now, info)
+    return info
+
+# Paths that do no real work and should skip request tracking entirely
+_UNTRACKED_PATHS = ('/health', '/stats', '/metrics', '/cache_stats')
+
 @app.before_request
 def before_request():
     global request_count, active_requests
-    request_count += 1
-    active_requests += 1
-    logger.info(f"Request #{request_count} started. Active requests: {active_requests}")
+    # CORS preflights are handled by flask-cors and browsers can send one
+    # per endpoint per session; don't count or rate-limit them
+    if request.method == 'OPTIONS' or request.path in _UNTRACKED_PATHS:
+        return
+    request_count = next(_req_ids)
+    with _counter_lock:
+        active_requests += 1
+    if _PROM_REQUESTS is not None:
+        _PROM_REQUESTS.inc()
+        _PROM_ACTIVE.inc()
+    logger.debug("Request #%d started. Active requests: %d", request_count, active_requests)
+    if os.getenv("PROFILE_MEMORY"):
+        logger.info("Memory at request #%d: %.1f MB rss", request_count,
+                    _meminfo().rss / (1024 * 1024))
 
 @app.after_request
 def after_request(response):
     global active_requests
-    active_requests -= 1
-    logger.info(f"Request completed. Active requests: {active_requests}")
-    gc.collect()  # Force garbage collection after each request
+    if request.method == 'OPTIONS' or request.path in _UNTRACKED_PATHS:
+        return response
+    with _counter_lock:
+        active_requests -= 1
+    if _PROM_ACTIVE is not None:
+        _PROM_ACTIVE.dec()
+    logger.debug("Request completed. Active requests: %d", active_requests)
+    # A full collection on every request stalls the worker; only sweep
+    # occasionally to keep long-lived garbage in check
+    if request_count % 100 == 0:
+        gc.collect()
     return response
 
 @app.route('/generate', methods=['POST'])
 @timeout_decorator(TIMEOUT_SECONDS)
-def generate():
+async def generate():
     start_time = time.time()
     try:
         # Log request information
-        logger.info(f"Received generate request from origin: {request.headers.get('Origin', 'Unknown')}")
-        logger.info(f"Request headers: {dict(request.headers)}")
+        logger.info("Received generate request from origin: %s", request.headers.get('Origin', 'Unknown'))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Request headers: %r", dict(request.headers))
         
         # Get JSON data
         data = request.get_json()
@@ -89,30 +249,193 @@ def generate():
         if not prompt:
             logger.error("No prompt provided in generate endpoint")
             return jsonify({'error': 'No prompt provided'}), 400
+
+        # Truncate once here so caches, single-flight and the LLM all see
+        # the same string
+        prompt = trim_prompt(prompt)
+
+        remaining = cooldown_remaining(request.remote_addr)
+        if remaining > 0:
+            logger.warning("Rate limited generate request from %s", request.remote_addr)
+            return jsonify({'error': 'Too many requests, please wait a moment',
+                            'retry_after': round(remaining, 1)}), 429
             
-        logger.info(f"Processing prompt: {prompt[:50]}...")
-        code = generate_manim_code(prompt)
+        logger.info("Processing prompt: %.50s...", prompt)
+
+        # Check the exact-match cache, then the semantic cache,
+        # before paying for an LLM call
+        cached = generate_exact.lookup(prompt)
+        if cached is None:
+            cached = generate_cache.lookup(prompt)
+        if cached is not None:
+            logger.info("Returning cached code in %.2f seconds", time.time() - start_time)
+            return jsonify({'code': cached})
+
+        code = await generate_manim_code_async(prompt)
+        # Failures come back as "// Error" strings; caching one would pin
+        # it to every similar prompt until the cache files are deleted
+        if not code.startswith("// Error"):
+            generate_exact.store(prompt, code)
+            generate_cache.store(prompt, code)
         processing_time = time.time() - start_time
-        logger.info(f"Successfully generated code in {processing_time:.2f} seconds")
+        logger.info("Successfully generated code in %.2f seconds", processing_time)
         
-        gc.collect()  # Clean up memory
         return jsonify({'code': code})
     except TimeoutError as e:
-        logger.error(f"Request timed out: {str(e)}")
+        logger.error("Request timed out: %s", str(e))
         gc.collect()  # Try to clean up memory
         return jsonify({'error': 'Request timed out', 'code': '// Error: The request took too long to process. Please try with a simpler prompt.'}), 408
     except Exception as e:
-        logger.error(f"Error in generate endpoint: {str(e)}", exc_info=True)
+        logger.error("Error in generate endpoint: %s", str(e), exc_info=True)
         gc.collect()  # Try to clean up memory
         return jsonify({'error': str(e), 'code': f"// Error generating code: {str(e)}"}), 500
 
 
+@app.route('/generate_stream', methods=['POST'])
+def generate_stream():
+    try:
+        logger.info("Received generate_stream request from origin: %s", request.headers.get('Origin', 'Unknown'))
+
+        data = request.get_json()
+        if not data:
+            logger.error("No JSON data received in generate_stream endpoint")
+            return jsonify({'error': 'No JSON data received'}), 400
+
+        prompt = data.get('prompt', '')
+        if not prompt:
+            logger.error("No prompt provided in generate_stream endpoint")
+            return jsonify({'error': 'No prompt provided'}), 400
+
+        # Truncate once here so caches, single-flight and the LLM all see
+        # the same string
+        prompt = trim_prompt(prompt)
+
+        remaining = cooldown_remaining(request.remote_addr)
+        if remaining > 0:
+            logger.warning("Rate limited generate_stream request from %s", request.remote_addr)
+            return jsonify({'error': 'Too many requests, please wait a moment',
+                            'retry_after': round(remaining, 1)}), 429
+
+        logger.info("Streaming prompt: %.50s...", prompt)
+
+        # Cache hits are streamed back as a single chunk
+        cached = generate_exact.lookup(prompt)
+        if cached is None:
+            cached = generate_cache.lookup(prompt)
+
+        def event_stream():
+            if cached is not None:
+                yield f"data: {json.dumps({'t': cached})}\n\n"
+                yield "data: [DONE]\n\n"
+                return
+            # Produce tokens on a worker thread so this generator can emit
+            # keepalive comments whenever the LLM goes quiet
+            token_queue = queue.Queue()
+            done = object()
+
+            def produce():
+                try:
+                    for token in generate_manim_code_stream(prompt):
+                        token_queue.put(token)
+                except Exception as e:
+                    token_queue.put(e)
+                finally:
+                    token_queue.put(done)
+
+            threading.Thread(target=produce, daemon=True).start()
+
+            chunks = []
+            pending = None
+            while True:
+                if pending is not None:
+                    item, pending = pending, None
+                else:
+                    try:
+                        item = token_queue.get(timeout=KEEPALIVE_SECONDS)
+                    except queue.Empty:
+                        # Comment lines are ignored by SSE clients but keep
+                        # proxies from timing out the idle connection
+                        yield ": keepalive\n\n"
+                        continue
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    yield f"data: {json.dumps({'error': str(item)})}\n\n"
+                    return
+                # Coalesce tokens already waiting in the queue into one
+                # SSE event (roughly one MTU) so a long response costs
+                # hundreds of socket writes instead of thousands
+                buf = [item]
+                buf_len = len(item)
+                while buf_len < SSE_FLUSH_BYTES:
+                    try:
+                        nxt = token_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if nxt is done or isinstance(nxt, Exception):
+                        pending = nxt
+                        break
+                    buf.append(nxt)
+                    buf_len += len(nxt)
+                text = ''.join(buf)
+                chunks.append(text)
+                yield f"data: {json.dumps({'t': text})}\n\n"
+            code = ''.join(chunks)
+            # The stream yields "// Error" text on failure; never cache it
+            if not code.startswith("// Error"):
+                generate_exact.store(prompt, code)
+                generate_cache.store(prompt, code)
+            yield "data: [DONE]\n\n"
+
+        return Response(stream_with_context(event_stream()), mimetype='text/event-stream')
+    except Exception as e:
+        logger.error("Error in generate_stream endpoint: %s", str(e), exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/batch_generate', methods=['POST'])
+@timeout_decorator(TIMEOUT_SECONDS)
+def batch_generate():
+    """Generate code for several prompts in one request.
+
+    The prompts run concurrently on the generation pool, so total wall
+    time approaches the slowest single generation instead of the sum."""
+    start_time = time.time()
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No JSON data received'}), 400
+
+        prompts = data.get('prompts')
+        if not isinstance(prompts, list) or not prompts:
+            return jsonify({'error': 'No prompts provided'}), 400
+        if len(prompts) > BATCH_MAX_PROMPTS:
+            return jsonify({'error': f'Too many prompts (max {BATCH_MAX_PROMPTS})'}), 400
+
+        remaining = cooldown_remaining(request.remote_addr)
+        if remaining > 0:
+            logger.warning("Rate limited batch request from %s", request.remote_addr)
+            return jsonify({'error': 'Too many requests, please wait a moment',
+                            'retry_after': round(remaining, 1)}), 429
+
+        prompts = [trim_prompt(p) for p in prompts]
+        codes = generate_many(prompts)
+        logger.info("Generated batch of %d in %.2f seconds", len(prompts), time.time() - start_time)
+        return jsonify({'codes': codes})
+    except TimeoutError as e:
+        logger.error("Batch request timed out: %s", str(e))
+        return jsonify({'error': 'Request timed out'}), 408
+    except Exception as e:
+        logger.error("Error in batch_generate endpoint: %s", str(e), exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/improve_prompt', methods=['POST'])
 @timeout_decorator(TIMEOUT_SECONDS)
-def improve_prompt_route():
+async def improve_prompt_route():
     start_time = time.time()
     try:
-        logger.info(f"Received improve_prompt request from origin: {request.headers.get('Origin', 'Unknown')}")
+        logger.info("Received improve_prompt request from origin: %s", request.headers.get('Origin', 'Unknown'))
         
         data = request.get_json()
         if not data:
@@ -123,55 +446,122 @@ def improve_prompt_route():
         if not prompt:
             logger.error("No prompt provided in improve_prompt endpoint")
             return jsonify({'error': 'No prompt provided'}), 400
+
+        # Truncate once here so caches, single-flight and the LLM all see
+        # the same string
+        prompt = trim_prompt(prompt)
+
+        remaining = cooldown_remaining(request.remote_addr)
+        if remaining > 0:
+            logger.warning("Rate limited improve_prompt request from %s", request.remote_addr)
+            return jsonify({'error': 'Too many requests, please wait a moment',
+                            'retry_after': round(remaining, 1)}), 429
             
-        logger.info(f"Processing prompt for improvement: {prompt[:50]}...")
-        improved = improve_prompt(prompt)
+        logger.info("Processing prompt for improvement: %.50s...", prompt)
+
+        # Check the exact-match cache, then the semantic cache,
+        # before paying for an LLM call
+        cached = improve_exact.lookup(prompt)
+        if cached is None:
+            cached = improve_cache.lookup(prompt)
+        if cached is not None:
+            logger.info("Returning cached improved prompt in %.2f seconds", time.time() - start_time)
+            return jsonify({'improved_prompt': cached})
+
+        improved = await improve_prompt_async(prompt)
+        improve_exact.store(prompt, improved)
+        improve_cache.store(prompt, improved)
         processing_time = time.time() - start_time
-        logger.info(f"Successfully improved prompt in {processing_time:.2f} seconds")
+        logger.info("Successfully improved prompt in %.2f seconds", processing_time)
         
-        gc.collect()  # Clean up memory
         return jsonify({'improved_prompt': improved})
     except TimeoutError as e:
-        logger.error(f"Request timed out: {str(e)}")
+        logger.error("Request timed out: %s", str(e))
         gc.collect()  # Try to clean up memory
         return jsonify({'error': 'Request timed out'}), 408
     except Exception as e:
-        logger.error(f"Error in improve_prompt_route: {str(e)}", exc_info=True)
+        logger.error("Error in improve_prompt_route: %s", str(e), exc_info=True)
         gc.collect()  # Try to clean up memory
         return jsonify({'error': str(e)}), 500
 
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        'exact': {'generate': generate_exact.stats(), 'improve_prompt': improve_exact.stats()},
+        'semantic': {'generate': generate_cache.stats(), 'improve_prompt': improve_cache.stats()},
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    if _PROM_REQUESTS is None:
+        return jsonify({'error': 'prometheus_client not installed'}), 404
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+
 @app.route('/health', methods=['GET'])
 def health_check():
     # Include memory and request info in health check
-    import psutil
-    process = psutil.Process(os.getpid())
-    memory_info = process.memory_info()
-    memory_mb = memory_info.rss / (1024 * 1024)
+    memory_mb = _meminfo().rss / (1024 * 1024)
     
     return jsonify({
         'status': 'ok',
         'memory_usage_mb': round(memory_mb, 2),
+        'uptime_seconds': round(time.time() - _START_TIME, 1),
         'active_requests': active_requests,
         'total_requests': request_count
     })
 
+# The /proc-derived half of /stats is syscall-heavy; refresh at most
+# every 5 seconds so frequent scrapers don't become a CPU sink
+_stats_sample = (0.0, None)
+
 @app.route('/stats', methods=['GET'])
 def stats():
-    # More detailed stats endpoint
-    import psutil
-    process = psutil.Process(os.getpid())
-    memory_info = process.memory_info()
-    
+    # More detailed stats endpoint, optionally gated by a shared secret
+    api_key = os.environ.get('STATS_API_KEY')
+    if api_key and request.headers.get('X-API-Key') != api_key:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    global _stats_sample
+    now = time.monotonic()
+    sampled_at, snapshot = _stats_sample
+    if snapshot is None or now - sampled_at > 5.0:
+        memory_info = _meminfo()
+        snapshot = {
+            'memory': {
+                'rss_mb': round(memory_info.rss / (1024 * 1024), 2),
+                'vms_mb': round(memory_info.vms / (1024 * 1024), 2),
+            },
+            'cpu_percent': _PROC.cpu_percent(),
+            'threads': len(_PROC.threads()),
+        }
+        _stats_sample = (now, snapshot)
+
     return jsonify({
-        'memory': {
-            'rss_mb': round(memory_info.rss / (1024 * 1024), 2),
-            'vms_mb': round(memory_info.vms / (1024 * 1024), 2),
-        },
-        'cpu_percent': process.cpu_percent(),
-        'threads': len(process.threads()),
+        **snapshot,
         'active_requests': active_requests,
         'total_requests': request_count
     })
 
+# With gunicorn preload_app this module is imported once in the master,
+# so eager initialization here is forked copy-on-write into every worker
+# instead of being repeated per worker
+if os.getenv("PRELOAD_MODELS", "1") == "1":
+    try:
+        get_llm()
+        warm_chains()
+        semantic_cache.warm()
+    except Exception as e:
+        logger.warning("Model preload failed, will initialize lazily: %s", str(e))
+
 if __name__ == '__main__':
-    app.run(port=5000)
+    # Settle startup allocations and freeze them so gen2 scans stay small
+    gc.collect()
+    gc.freeze()
+    # Dev server only; production runs under gunicorn (see gunicorn.conf.py).
+    # The reloader stays off: it double-forks the process and adds a
+    # file-watch thread for no benefit here
+    app.run(host='0.0.0.0',
+            port=int(os.environ.get('PORT', 5000)),
+            debug=os.environ.get('FLASK_DEBUG') == '1',
+            use_reloader=False,
+            threaded=True)
@@ -0,0 +1,75 @@
+import hashlib
+import os
+import threading
+import time
+import logging
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+MAX_ENTRIES = int(os.getenv("LLM_CACHE_SIZE", "10000"))
+TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL", "3600"))
+
+
+def normalized_key(prompt):
+    """SHA-256 of the whitespace-normalized, lowercased prompt"""
+    return hashlib.sha256(" ".join(prompt.split()).lower().encode()).hexdigest()
+
+
+class ExactCache:
+    """Exact-match TTL cache keyed by normalized prompt hash.
+
+    Checked before the semantic cache: a dict lookup is O(1) and avoids
+    even the embedding cost when the prompt is a true repeat.
+    """
+
+    def __init__(self, name, maxsize=MAX_ENTRIES, ttl=TTL_SECONDS):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = {}  # key -> (expires_at, response)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, prompt):
+        """Return the cached response for an identical prompt, or None on miss"""
+        key = normalized_key(prompt)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, response = entry
+            if expires_at < time.time():
+                del self.entries[key]
+                self.misses += 1
+                return None
+            self.hits += 1
+        logger.info("Exact cache hit on '%s'", self.name)
+        return response
+
+    def store(self, prompt, response):
+        """Add a prompt/response pair, evicting expired/oldest entries when full"""
+        key = normalized_key(prompt)
+        now = time.time()
+        with self.lock:
+            if len(self.entries) >= self.maxsize:
+                # Drop expired entries first, then the oldest if still full
+                expired = [k for k, (exp, _) in self.entries.items() if exp < now]
+                for k in expired:
+                    del self.entries[k]
+                while len(self.entries) >= self.maxsize:
+                    self.entries.pop(next(iter(self.entries)))
+            self.entries[key] = (now + self.ttl, response)
+
+
+    def stats(self):
+        """Size and hit/miss counters for the /cache_stats endpoint"""
+        with self.lock:
+            return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+
+# One cache per endpoint, mirroring the semantic caches
+generate_exact = ExactCache("generate")
+improve_exact = ExactCache("improve_prompt")
@@ -0,0 +1,29 @@
+import multiprocessing
+import os
+
+# The endpoints block for seconds on outbound LLM HTTP calls, so use
+# threaded workers by default: each process keeps many blocked requests
+# in flight. Set GUNICORN_WORKER_CLASS=gevent for greenlet workers that
+# hold far more concurrent LLM calls per process (wsgi.py monkey-patches
+# sockets before the app import in that case).
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+workers = multiprocessing.cpu_count() * 2 + 1
+threads = 8
+worker_connections = 1000
+
+# Import the app once in the master and fork, instead of once per worker
+preload_app = True
+
+# Must exceed the in-app view deadline (REQUEST_TIMEOUT + 10) so the
+# decorator fires before gunicorn kills the worker
+timeout = int(os.getenv("REQUEST_TIMEOUT", "180")) + 20
+
+loglevel = "info"
+
+
+def when_ready(server):
+    # With preload_app the app is fully imported in the master by now;
+    # freeze those long-lived objects so workers' gen2 scans skip them
+    import gc
+    gc.collect()
+    gc.freeze()
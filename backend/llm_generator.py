@@ -1,12 +1,18 @@
-import langchain
-from openai import OpenAI
 from langchain_openai import ChatOpenAI  # Updated import
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
-from langchain.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
+from langchain.prompts import SystemMessagePromptTemplate
+from langchain_core.messages import HumanMessage
+from aiolimiter import AsyncLimiter
+from llm_retry import with_backoff, backoff_delay, is_retryable
+import atexit
 import os
-import gc
+from pathlib import Path
+import re
+import httpx
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import logging
+import asyncio
 from dotenv import load_dotenv
 import time
 
@@ -22,113 +28,199 @@ OPENROUTER_API_BASE = os.getenv("OPENROUTER_API_BASE", "https://openrouter.ai/ap
 DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", "meta-llama/llama-4-maverick:free")
 FALLBACK_MODEL = os.getenv("FALLBACK_MODEL", "meta-llama/llama-4-maverick:free")  # Fallback model
 MAX_RETRIES = int(os.getenv("MAX_RETRIES", "3"))
+MAX_PROMPT_CHARS = int(os.getenv("MAX_PROMPT_CHARS", "5000"))
+MAX_PROMPT_TOKENS = int(os.getenv("MAX_PROMPT_TOKENS", "2048"))
+MAX_CODE_SIZE = int(os.getenv("MAX_CODE_SIZE", "100000"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "10"))
+LLM_RPM = int(os.getenv("LLM_RPM", "60"))
+LLM_MAX_OUTPUT_TOKENS = int(os.getenv("LLM_MAX_OUTPUT_TOKENS", "4096"))
 REQUEST_TIMEOUT = int(os.getenv("REQUEST_TIMEOUT", "180"))
 
-# Global LLM instance
-_llm_instance = None
-_using_fallback = False
+# One pooled HTTP client shared by every LLM call, so TCP connections and
+# TLS sessions to OpenRouter are reused instead of re-handshaking per call.
+# HTTP/2 multiplexes concurrent calls over few connections when the h2
+# extra is installed; fall back to HTTP/1.1 pooling otherwise.
+_http_limits = httpx.Limits(max_connections=256, max_keepalive_connections=64,
+                            keepalive_expiry=300)
+_http_timeout = httpx.Timeout(REQUEST_TIMEOUT, connect=10)
+try:
+    _http_client = httpx.Client(http2=True, limits=_http_limits, timeout=_http_timeout)
+    _http_async_client = httpx.AsyncClient(http2=True, limits=_http_limits, timeout=_http_timeout)
+except ImportError:
+    logger.warning("httpx h2 extra not installed, using HTTP/1.1")
+    _http_client = httpx.Client(limits=_http_limits, timeout=_http_timeout)
+    _http_async_client = httpx.AsyncClient(limits=_http_limits, timeout=_http_timeout)
+
+# Close the pooled connections on interpreter shutdown rather than
+# leaking sockets for the OS to reap
+atexit.register(_http_client.close)
+
+class _TokenBucket:
+    """Thread-safe token bucket pacing outbound LLM calls to LLM_RPM.
+
+    Spending a 429 round-trip to learn we are over the provider's rate
+    limit wastes latency; blocking a few hundred ms here first keeps the
+    request inside the limit and out of the retry path entirely."""
+
+    def __init__(self, rate_per_minute):
+        self.capacity = max(1, rate_per_minute)
+        self.fill_rate = self.capacity / 60.0
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request token is available"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.fill_rate
+            time.sleep(wait)
+
+
+_rpm_bucket = _TokenBucket(LLM_RPM)
+
+
+# BPE table load is ~50 ms, so the encoding is built once and reused.
+# tiktoken stays optional: without it we fall back to character trimming.
+_encoding = None
+_encoding_lock = threading.Lock()
+_encoding_disabled = False
+
+
+def _get_encoding():
+    global _encoding, _encoding_disabled
+    if _encoding is None and not _encoding_disabled:
+        with _encoding_lock:
+            if _encoding is None and not _encoding_disabled:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding("cl100k_base")
+                except Exception as e:
+                    logger.warning("tiktoken unavailable, trimming by characters (%s)", str(e))
+                    _encoding_disabled = True
+    return _encoding
+
+
+def trim_prompt(prompt):
+    """Truncate over-long prompts once at the boundary.
+
+    Trims on token count (what the provider actually bills and times)
+    rather than characters, so LaTeX-heavy prompts aren't over- or
+    under-cut. Views call this before cache lookups so the whole
+    pipeline sees the same string and no downstream copy is needed."""
+    enc = _get_encoding()
+    if enc is not None:
+        tokens = enc.encode(prompt)
+        if len(tokens) > MAX_PROMPT_TOKENS:
+            logger.warning("Prompt too long (%d tokens), trimming to %d tokens", len(tokens), MAX_PROMPT_TOKENS)
+            return enc.decode(tokens[:MAX_PROMPT_TOKENS])
+        return prompt
+    if len(prompt) > MAX_PROMPT_CHARS:
+        logger.warning("Prompt too long (%d chars), trimming to %d chars", len(prompt), MAX_PROMPT_CHARS)
+        return prompt[:MAX_PROMPT_CHARS]
+    return prompt
+
+
+# Strip a leading ```python fence and trailing ``` in one compiled pass
+# instead of two startswith/endswith scans plus slice copies
+_FENCE = re.compile(r"\A\s*```(?:python)?[ \t]*\n?|\n?```\s*\Z")
+
+# One client per model tier, built lazily and kept for the process
+# lifetime: flipping to the fallback must not tear down the primary
+# client (Pydantic validation, header setup) or orphan warm connections
+_llms = {}
+_llm_lock = threading.Lock()
 
 def get_llm(use_fallback=False):
-    """Lazy-load the LLM instance only when needed"""
-    global _llm_instance, _using_fallback
-    
-    # Reset the instance if we're switching between primary and fallback
-    if use_fallback and not _using_fallback:
-        _llm_instance = None
-        _using_fallback = True
-    elif not use_fallback and _using_fallback:
-        _llm_instance = None
-        _using_fallback = False
-    
-    if _llm_instance is None:
+    """Return the cached client for the requested model tier"""
+    model = FALLBACK_MODEL if use_fallback else DEFAULT_MODEL
+    llm = _llms.get(model)
+    if llm is not None:
+        return llm
+    with _llm_lock:
+        llm = _llms.get(model)
+        if llm is not None:
+            return llm
         try:
-            # Choose which model to use
-            model = FALLBACK_MODEL if use_fallback else DEFAULT_MODEL
-            
-            logger.info(f"Creating LLM instance with model: {model}")
-            logger.info(f"API Base: {OPENROUTER_API_BASE}")
+            logger.info("Creating LLM instance with model: %s", model)
+            logger.info("API Base: %s", OPENROUTER_API_BASE)
             
-            # Add HTTP headers required by OpenRouter
+            # Add HTTP headers required by OpenRouter; the opt-in
+            # prompt-caching header lets the provider reuse the prefill of
+            # our byte-identical system-prompt prefix across requests
             headers = {
                 "HTTP-Referer": "https://automanim.app",  # Replace with your actual domain
-                "X-Title": "AutoManim"
+                "X-Title": "AutoManim",
+                "OpenAI-Beta": "prompt-caching=v1"
             }
             
-            _llm_instance = ChatOpenAI(
+            llm = ChatOpenAI(
                 openai_api_key=OPENROUTER_API_KEY,
                 openai_api_base=OPENROUTER_API_BASE,
                 model_name=model,
                 request_timeout=REQUEST_TIMEOUT,
                 max_retries=2,
-                default_headers=headers
+                max_tokens=LLM_MAX_OUTPUT_TOKENS,
+                default_headers=headers,
+                http_client=_http_client,
+                http_async_client=_http_async_client
             )
-            logger.info(f"LLM instance created successfully using {'fallback' if use_fallback else 'primary'} model")
+            logger.info("LLM instance created successfully using %s model", "fallback" if use_fallback else "primary")
         except Exception as e:
-            logger.error(f"Error creating LLM instance: {str(e)}")
+            logger.error("Error creating LLM instance: %s", str(e))
             raise
-    return _llm_instance
+        _llms[model] = llm
+    return llm
+
+# The system prompts live in backend/prompts/ so they can be edited
+# without a code deploy; each is read once at import and baked into a
+# SystemMessage below
+_PROMPT_DIR = Path(__file__).resolve().parent / "prompts"
+GENERATE_SYSTEM_TEMPLATE = (_PROMPT_DIR / "system_code.txt").read_text(encoding="utf-8")
+IMPROVE_SYSTEM_TEMPLATE = (_PROMPT_DIR / "system_improve.txt").read_text(encoding="utf-8")
+
+# Format the static system messages once at import: they contain no
+# template variables, and a byte-for-byte identical prefix across calls
+# lets the provider reuse its prompt-prefix (KV) cache
+GENERATE_SYSTEM_MESSAGE = SystemMessagePromptTemplate.from_template(GENERATE_SYSTEM_TEMPLATE).format()
+IMPROVE_SYSTEM_MESSAGE = SystemMessagePromptTemplate.from_template(IMPROVE_SYSTEM_TEMPLATE).format()
+
+# With the system messages pre-baked, per-call message construction is
+# just a two-element list plus one HumanMessage — no chat-template
+# parsing or formatting machinery on the request path
+def _generate_messages(prompt):
+    return [GENERATE_SYSTEM_MESSAGE, HumanMessage(content=f"Question : {prompt}")]
+
+
+def _improve_messages(prompt):
+    return [IMPROVE_SYSTEM_MESSAGE, HumanMessage(content=f"Prompt: {prompt}")]
+
 
 def generate_manim_code(prompt):
     try:
-        # Trim prompt if it's too long
-        if len(prompt) > 5000:
-            logger.warning(f"Prompt too long ({len(prompt)} chars), trimming to 5000 chars")
-            prompt = prompt[:5000]
-            
-        logger.info(f"Generating Manim code for prompt of length {len(prompt)}")
-        
-        system_template = """
-You are an expert programmer specializing in creating Manim animations for educational content. Your task is to write clean, executable Manim code that implements the user's request completely.
-
-Key requirements:
-1. Import necessary modules (manim, numpy, etc.)
-2. Create a Scene class with a descriptive name
-3. Implement a full construct method with all requested features
-4. Include helper methods as needed for organization
-5. Implement complete, functioning code without TODOs or placeholders
-6. Add appropriate wait times between animation steps
-7. Include the render code with if __name__ == "__main__"
-
-Your response must ONLY contain the Python code, with no additional explanations outside code comments.
-
-Example structure:
-```python
-from manim import *
-import numpy as np
-
-class YourAnimation(Scene):
-    def construct(self):
-        # Complete implementation here
-        title = Text("Animation Title")
-        self.play(Write(title))
-        self.wait(1)
-        
-        # Rest of the implementation
-        # ...
-
-if __name__ == "__main__":
-    scene = YourAnimation()
-    scene.render()
-```"""
-        systemMessage = SystemMessagePromptTemplate.from_template(system_template)
-        human_template = "Question : {question}"
-        human_message = HumanMessagePromptTemplate.from_template(human_template)
-        chat_prompt = ChatPromptTemplate.from_messages([systemMessage, human_message])
+        logger.info("Generating Manim code for prompt of length %d", len(prompt))
         
+        # Format once; retries and the fallback tier reuse the same messages
+        messages = _generate_messages(prompt)
+
         # Try with primary model first, then fallback if needed
         use_fallback = False
-        retry_delay = 2  # seconds
         total_attempts = 0
         
         for model_attempt in range(2):  # Try primary, then fallback if needed
             if total_attempts >= MAX_RETRIES:
                 break
                 
-            # Try to get the LLM instance
             try:
                 llm = get_llm(use_fallback=use_fallback)
             except Exception as e:
-                logger.error(f"Failed to initialize {'fallback' if use_fallback else 'primary'} LLM: {str(e)}")
+                logger.error("Failed to initialize %s LLM: %s", "fallback" if use_fallback else "primary", str(e))
                 if not use_fallback:
                     # Try fallback model
                     use_fallback = True
@@ -136,51 +228,55 @@ if __name__ == "__main__":
                 else:
                     # Both models failed to initialize
                     return f"// Error: Failed to initialize AI models: {str(e)}"
-
-            # Create a new chain for each request to avoid memory leaks
-            llm_chain = LLMChain(prompt=chat_prompt, llm=llm)
             
             # Add retry logic for API calls
             for attempt in range(MAX_RETRIES - total_attempts):
                 total_attempts += 1
                 try:
                     model_type = "fallback" if use_fallback else "primary"
-                    logger.info(f"Attempt {total_attempts}/{MAX_RETRIES} using {model_type} model")
-                    
-                    response = llm_chain.invoke({"question": prompt})
+                    logger.info("Attempt %d/%d using %s model", total_attempts, MAX_RETRIES, model_type)
                     
-                    # Extract the text from the response object and clear references
-                    if isinstance(response, dict) and "text" in response:
-                        result = response["text"]
-                        # Clear references
-                        response.clear()
-                    else:
-                        result = str(response)
+                    # AIMessage always carries .content; no dict unwrapping
+                    _rpm_bucket.acquire()
+                    response = llm.invoke(messages)
+                    result = response.content
+                    if response.response_metadata.get("finish_reason") == "length":
+                        logger.warning("Generation truncated at LLM_MAX_OUTPUT_TOKENS=%d", LLM_MAX_OUTPUT_TOKENS)
                     
                     # Successfully got a response, break the retry loop
-                    logger.info(f"Successfully generated code using {model_type} model")
+                    logger.info("Successfully generated code using %s model", model_type)
                     
-                    # Optionally, strip markdown code block markers
-                    if result.startswith("```python"):
-                        result = result[len("```python"):].strip()
-                    if result.endswith("```"):
-                        result = result[:-3].strip()
-                        
-                    # Force garbage collection to free memory
-                    chat_prompt = None
-                    llm_chain = None
-                    gc.collect()
+                    # The system prompt forbids fences; in the common
+                    # clean case a single startswith check skips the
+                    # regex scan over the whole response
+                    if result.lstrip().startswith("```"):
+                        logger.debug("Model emitted markdown fences despite instructions")
+                        result = _FENCE.sub("", result).strip()
+                    else:
+                        result = result.strip()
                     
-                    logger.info(f"Successfully generated code of length {len(result)}")
+                    logger.info("Successfully generated code of length %d", len(result))
                     return result
                     
                 except Exception as e:
-                    logger.error(f"Attempt {total_attempts} with {model_type} model failed: {str(e)}")
+                    logger.error("Attempt %d with %s model failed: %s", total_attempts, model_type, str(e))
+                    if not is_retryable(e):
+                        # Auth errors, bad requests and unknown models fail
+                        # identically every attempt; skip the remaining
+                        # same-model retries and their backoff sleeps, but
+                        # give the fallback tier one chance before
+                        # surfacing the error
+                        if use_fallback or total_attempts >= MAX_RETRIES:
+                            raise
+                        logger.info("Switching to fallback model after non-retryable error")
+                        use_fallback = True
+                        break
                     if total_attempts < MAX_RETRIES:
-                        logger.info(f"Retrying in {retry_delay} seconds...")
-                        time.sleep(retry_delay)
-                        retry_delay *= 1.5  # Exponential backoff
-                        gc.collect()  # Force garbage collection between retries
+                        # Jittered exponential backoff so parallel workers
+                        # don't retry against the rate limit in lockstep
+                        delay = backoff_delay(total_attempts - 1, base=2.0)
+                        logger.info("Retrying in %.1f seconds...", delay)
+                        time.sleep(delay)
                     
                     # If using primary model and hit an error, try fallback
                     if not use_fallback and total_attempts >= (MAX_RETRIES // 2):
@@ -193,52 +289,245 @@ if __name__ == "__main__":
         return "// Error: Unable to generate code after multiple attempts. Please try again with a simpler prompt."
 
     except Exception as e:
-        logger.error(f"Error generating code: {str(e)}", exc_info=True)
-        gc.collect()  # Try to free memory even on failure
+        logger.error("Error generating code: %s", str(e), exc_info=True)
         return f"// Error generating code: {str(e)}\n// Please try again with a simpler prompt or contact support if the issue persists."
 
-def improve_prompt(prompt):
-    logger.info("improve_prompt function called")
-    try: 
-        # Trim prompt if it's too long
-        if len(prompt) > 5000:
-            logger.warning(f"Prompt too long ({len(prompt)} chars), trimming to 5000 chars")
-            prompt = prompt[:5000]
-            
-        system_template = """
-Your task is to expand a user's vague animation request into detailed instructions for creating a Manim animation.
+# Single-flight deduplication: concurrent identical prompts share one
+# in-flight LLM call instead of each paying full latency and cost
+_inflight = {}
+_inflight_lock = threading.Lock()
+_inflight_pool = ThreadPoolExecutor(max_workers=16)
 
-Provide specific details on:
-1. Visual elements to include (shapes, equations, text)
-2. Animation sequences and transitions
-3. Colors, positions, and styling
-4. Timing and flow of the animation
-5. Mathematical formulas and notations (if applicable)
+def _single_flight_submit(kind, fn, prompt):
+    """Return the in-flight future for this prompt, creating it if absent"""
+    key = f"{kind}:{hashlib.sha256(prompt.encode()).hexdigest()}"
+    with _inflight_lock:
+        future = _inflight.get(key)
+        if future is None:
+            future = _inflight_pool.submit(fn, prompt)
+            _inflight[key] = future
 
-Do NOT generate code. Instead, provide a detailed description that would allow a programmer to implement the animation without guesswork.
+            def _clear(_):
+                with _inflight_lock:
+                    _inflight.pop(key, None)
 
-Format your response as a clear, detailed specification, focusing on Manim's specific objects and methods."""
-        system_message = SystemMessagePromptTemplate.from_template(system_template)
+            future.add_done_callback(_clear)
+        else:
+            logger.info("Joining in-flight %s call for identical prompt", kind)
+    return future
 
-        human_template = "Prompt: {prompt}"
-        human_message = HumanMessagePromptTemplate.from_template(human_template)
 
-        chat_prompt = ChatPromptTemplate.from_messages([system_message, human_message])
-        
+def _single_flight(kind, fn, prompt):
+    return _single_flight_submit(kind, fn, prompt).result()
+
+
+_OPEN_FENCE = re.compile(r"\A\s*```(?:python)?[ \t]*\n?")
+_CLOSE_FENCE = re.compile(r"\n?```\s*\Z")
+
+class _FenceStripper:
+    """Stateful markdown-fence stripping shared by both stream paths.
+
+    Buffers just enough to recognize an opening ```python fence, holds
+    back a short tail so a closing fence split across chunks is caught,
+    and marks the stream done once MAX_CODE_SIZE chars have been emitted
+    instead of truncating after the fact. Keeping the state machine in
+    one class lets the sync and async generators stay thin wrappers."""
+
+    def __init__(self):
+        self.emitted = 0
+        self.buf = ""
+        self.opened = False
+        self.done = False
+
+    def feed(self, chunk):
+        """Absorb one chunk; return text ready to emit (may be empty)"""
+        if self.done:
+            return ""
+        self.buf += chunk
+        if not self.opened:
+            # Sniff past any leading whitespace: a chunk that starts with
+            # a newline must not cut the buffering short before the fence
+            # itself has arrived
+            head = self.buf.lstrip()
+            if "\n" not in head and len(head) < 16:
+                return ""
+            self.buf = _OPEN_FENCE.sub("", self.buf)
+            self.opened = True
+        if len(self.buf) > 4:
+            out, self.buf = self.buf[:-4], self.buf[-4:]
+            if self.emitted + len(out) >= MAX_CODE_SIZE:
+                logger.warning("Streamed output hit MAX_CODE_SIZE (%d chars), terminating", MAX_CODE_SIZE)
+                self.done = True
+                return out[:MAX_CODE_SIZE - self.emitted]
+            self.emitted += len(out)
+            return out
+        return ""
+
+    def flush(self):
+        """Emit whatever the held-back tail holds after the close fence"""
+        if self.done:
+            return ""
+        return _CLOSE_FENCE.sub("", self.buf)
+
+
+def _strip_fences_stream(chunks):
+    """Strip markdown fences on the fly while streaming"""
+    stripper = _FenceStripper()
+    for chunk in chunks:
+        out = stripper.feed(chunk)
+        if out:
+            yield out
+        if stripper.done:
+            return
+    tail = stripper.flush()
+    if tail:
+        yield tail
+
+
+def generate_manim_code_stream(prompt):
+    """Yield Manim code chunks as the LLM produces them.
+
+    Used by the SSE endpoint so the client sees the first tokens in
+    first-token time instead of waiting for the whole completion.
+    Failures propagate as exceptions rather than being yielded as text:
+    a mid-stream error yielded after real tokens would be
+    indistinguishable from code to the caller (and end up cached)."""
+    messages = _generate_messages(prompt)
+
+    llm = get_llm()
+
+    def tokens():
+        _rpm_bucket.acquire()
+        for chunk in llm.stream(messages):
+            if chunk.content:
+                yield chunk.content
+
+    yield from _strip_fences_stream(tokens())
+
+
+async def agenerate_manim_code_stream(prompt):
+    """Native-async twin of generate_manim_code_stream for ASGI servers.
+
+    Yields fence-stripped code chunks from astream so an async route can
+    forward them as SSE without pinning a worker thread per stream."""
+    prompt = trim_prompt(prompt)
+    messages = _generate_messages(prompt)
+    stripper = _FenceStripper()
+    async with _async_sem, _rpm_limiter:
+        async for chunk in get_llm().astream(messages):
+            if not chunk.content:
+                continue
+            out = stripper.feed(chunk.content)
+            if out:
+                yield out
+            if stripper.done:
+                return
+    tail = stripper.flush()
+    if tail:
+        yield tail
+
+
+# Fan-out pool for multi-prompt helpers; separate from the single-flight
+# pool so nested submissions can't deadlock it
+_EXEC = ThreadPoolExecutor(max_workers=16)
+
+def generate_many(prompts):
+    """Generate code for several prompts concurrently.
+
+    Unlike generate_manim_code_batch this runs each prompt through the
+    full retry/fallback path, overlapping the LLM calls on a thread pool
+    and sharing in-flight duplicates via single-flight."""
+    return list(_EXEC.map(
+        lambda prompt: _single_flight("generate", generate_manim_code, prompt), prompts))
+
+
+def improve_many(prompts):
+    """Improve several prompts concurrently, mirroring generate_many"""
+    return list(_EXEC.map(
+        lambda prompt: _single_flight("improve", improve_prompt, prompt), prompts))
+
+
+# Caps concurrent in-flight LLM calls on the native-async path so a
+# burst can't exhaust the provider's rate limit in one salvo, plus the
+# async twin of _rpm_bucket for per-minute pacing
+_async_sem = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+_rpm_limiter = AsyncLimiter(LLM_RPM, 60)
+
+async def agenerate_manim_code(prompt):
+    """Native-async generation for single-event-loop (ASGI) servers.
+
+    The Flask views use the thread-backed *_async wrappers below; this
+    path lets an ASGI deployment multiplex many in-flight OpenRouter
+    calls on one event loop, capped by LLM_MAX_CONCURRENCY."""
+    prompt = trim_prompt(prompt)
+    messages = _generate_messages(prompt)
+    async with _async_sem, _rpm_limiter:
+        response = await with_backoff(lambda: get_llm().ainvoke(messages))
+    return _FENCE.sub("", response.content).strip()
+
+
+async def aimprove_prompt(prompt):
+    """Native-async prompt improvement mirroring agenerate_manim_code"""
+    prompt = trim_prompt(prompt)
+    messages = _improve_messages(prompt)
+    async with _async_sem, _rpm_limiter:
+        response = await with_backoff(lambda: get_llm().ainvoke(messages))
+    return response.content.strip()
+
+
+async def agenerate_many(prompts):
+    """Generate code for many prompts concurrently on one event loop.
+
+    asyncio.gather overlaps the network latency of every prompt while
+    the shared semaphore and RPM limiter keep the burst inside provider
+    limits. Failures are mapped to the same "// Error" strings the sync
+    path returns, so one bad prompt never poisons the batch."""
+    results = await asyncio.gather(
+        *(agenerate_manim_code(p) for p in prompts), return_exceptions=True)
+    return [f"// Error generating code: {str(r)}" if isinstance(r, Exception) else r
+            for r in results]
+
+
+def warm_chains():
+    """Prewarm the primary model client.
+
+    Kept as the preload hook from the chain era: templates are import-time
+    constants now and calls go straight to llm.invoke, so the only state
+    worth building ahead of the first request is the client itself."""
+    try:
+        get_llm()
+    except Exception as e:
+        logger.warning("Model prewarm failed, will build lazily: %s", str(e))
+
+
+async def generate_manim_code_async(prompt):
+    """Await the (possibly shared) in-flight generation.
+
+    The LangChain call runs on the single-flight pool and the view's
+    event loop awaits its future directly, so no extra thread is pinned
+    per request just to wait on the result."""
+    future = _single_flight_submit("generate", generate_manim_code, prompt)
+    return await asyncio.wrap_future(future)
+
+
+def improve_prompt(prompt):
+    logger.info("improve_prompt function called")
+    try: 
+        # Format once; retries and the fallback tier reuse the same messages
+        messages = _improve_messages(prompt)
+
         # Try with primary model first, then fallback if needed
         use_fallback = False
-        retry_delay = 2  # seconds
         total_attempts = 0
         
         for model_attempt in range(2):  # Try primary, then fallback if needed
             if total_attempts >= MAX_RETRIES:
                 break
                 
-            # Try to get the LLM instance
             try:
                 llm = get_llm(use_fallback=use_fallback)
             except Exception as e:
-                logger.error(f"Failed to initialize {'fallback' if use_fallback else 'primary'} LLM: {str(e)}")
+                logger.error("Failed to initialize %s LLM: %s", "fallback" if use_fallback else "primary", str(e))
                 if not use_fallback:
                     # Try fallback model
                     use_fallback = True
@@ -246,45 +535,45 @@ Format your response as a clear, detailed specification, focusing on Manim's spe
                 else:
                     # Both models failed to initialize
                     raise Exception(f"Failed to initialize AI models: {str(e)}")
-
-            # Create a new chain for each request
-            llm_chain = LLMChain(prompt=chat_prompt, llm=llm)
             
             # Add retry logic for API calls
             for attempt in range(MAX_RETRIES - total_attempts):
                 total_attempts += 1
                 try:
                     model_type = "fallback" if use_fallback else "primary"
-                    logger.info(f"Attempt {total_attempts}/{MAX_RETRIES} using {model_type} model to improve prompt")
-                    
-                    response = llm_chain.invoke({"prompt": prompt})
+                    logger.info("Attempt %d/%d using %s model to improve prompt", total_attempts, MAX_RETRIES, model_type)
                     
-                    # Extract the text from the response object
-                    if isinstance(response, dict) and "text" in response:
-                        improved = response["text"]
-                        # Clear references
-                        response.clear()
-                    else:
-                        improved = str(response)
+                    # AIMessage always carries .content; no dict unwrapping
+                    _rpm_bucket.acquire()
+                    response = llm.invoke(messages)
+                    improved = response.content
+                    if response.response_metadata.get("finish_reason") == "length":
+                        logger.warning("Improvement truncated at LLM_MAX_OUTPUT_TOKENS=%d", LLM_MAX_OUTPUT_TOKENS)
                     
                     # Successfully got a response
-                    logger.info(f"Successfully improved prompt using {model_type} model")
-                    
-                    # Clear references to help with garbage collection
-                    chat_prompt = None
-                    llm_chain = None
-                    gc.collect()
-                    
-                    logger.info(f"Successfully improved prompt of length {len(improved)}")
+                    logger.info("Successfully improved prompt using %s model", model_type)
+                    logger.info("Successfully improved prompt of length %d", len(improved))
                     return improved.strip()
                     
                 except Exception as e:
-                    logger.error(f"Attempt {total_attempts} with {model_type} model failed: {str(e)}")
+                    logger.error("Attempt %d with %s model failed: %s", total_attempts, model_type, str(e))
+                    if not is_retryable(e):
+                        # Auth errors, bad requests and unknown models fail
+                        # identically every attempt; skip the remaining
+                        # same-model retries and their backoff sleeps, but
+                        # give the fallback tier one chance before
+                        # surfacing the error
+                        if use_fallback or total_attempts >= MAX_RETRIES:
+                            raise
+                        logger.info("Switching to fallback model after non-retryable error")
+                        use_fallback = True
+                        break
                     if total_attempts < MAX_RETRIES:
-                        logger.info(f"Retrying in {retry_delay} seconds...")
-                        time.sleep(retry_delay)
-                        retry_delay *= 1.5  # Exponential backoff
-                        gc.collect()  # Force garbage collection between retries
+                        # Jittered exponential backoff so parallel workers
+                        # don't retry against the rate limit in lockstep
+                        delay = backoff_delay(total_attempts - 1, base=2.0)
+                        logger.info("Retrying in %.1f seconds...", delay)
+                        time.sleep(delay)
                     
                     # If using primary model and hit an error, try fallback
                     if not use_fallback and total_attempts >= (MAX_RETRIES // 2):
@@ -297,6 +586,10 @@ Format your response as a clear, detailed specification, focusing on Manim's spe
         raise Exception("Unable to improve prompt after multiple attempts. Please try again with a clearer prompt.")
         
     except Exception as e:
-        logger.error(f"Error in improve_prompt: {str(e)}", exc_info=True)
-        gc.collect()  # Try to free memory even on failure
-        raise Exception(f"Failed to improve prompt: {str(e)}")
\ No newline at end of file
+        logger.error("Error in improve_prompt: %s", str(e), exc_info=True)
+        raise Exception(f"Failed to improve prompt: {str(e)}")
+
+async def improve_prompt_async(prompt):
+    """Async wrapper mirroring generate_manim_code_async"""
+    future = _single_flight_submit("improve", improve_prompt, prompt)
+    return await asyncio.wrap_future(future)
@@ -0,0 +1,57 @@
+import asyncio
+import logging
+import os
+import random
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+MAX_RETRIES = int(os.environ.get("MAX_RETRIES", "3"))
+
+
+def is_retryable(exc):
+    """True for errors worth retrying: rate limits, timeouts, provider 5xx.
+
+    Bad requests, auth failures and the like fail the same way every time,
+    so retrying them only burns the user's wait budget.
+    """
+    if type(exc).__name__ in (
+        "RateLimitError",
+        "APITimeoutError",
+        "APIConnectionError",
+        "InternalServerError",
+        "ServiceUnavailableError",
+    ):
+        return True
+    status = getattr(exc, "status_code", None)
+    return status == 429 or (status is not None and status >= 500)
+
+
+def backoff_delay(attempt, base=1.0, cap=30.0):
+    """Jittered exponential delay for a zero-based attempt number.
+
+    The jitter (up to 20% of the delay) de-synchronizes clients that all
+    hit the same shared rate limit at once, so retries don't arrive as a
+    second thundering herd.
+    """
+    delay = min(base * (2 ** attempt), cap)
+    return delay + random.uniform(0, delay * 0.2)
+
+
+async def with_backoff(fn, *, max_retries=MAX_RETRIES, base=1.0, cap=30.0):
+    """Await fn() with jittered exponential backoff on retryable errors.
+
+    fn is a zero-argument callable returning a coroutine (typically a
+    lambda closing over prebuilt messages). Non-retryable errors and the
+    final failed attempt propagate to the caller; the waits use
+    asyncio.sleep so the event loop keeps serving other requests.
+    """
+    for attempt in range(max_retries):
+        try:
+            return await fn()
+        except Exception as e:
+            if not is_retryable(e) or attempt >= max_retries - 1:
+                raise
+            delay = backoff_delay(attempt, base, cap)
+            logger.info("Retryable LLM error (%s), retrying in %.1fs", type(e).__name__, delay)
+            await asyncio.sleep(delay)
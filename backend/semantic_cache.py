@@ -0,0 +1,164 @@
+import os
+import json
+import threading
+import logging
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Cosine similarity needed before a stored response is considered a hit
+SIMILARITY_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+EMBEDDING_MODEL = os.getenv("SEMANTIC_CACHE_MODEL", "all-MiniLM-L6-v2")
+CACHE_DIR = os.getenv("SEMANTIC_CACHE_DIR", os.path.join(os.path.dirname(__file__), ".semantic_cache"))
+PERSIST_DELAY = float(os.getenv("SEMANTIC_CACHE_PERSIST_DELAY", "5"))
+
+# Shared embedding model, loaded lazily like the LLM instance in llm_generator
+_model = None
+_model_lock = threading.Lock()
+_disabled = False
+
+
+def _get_model():
+    """Lazy-load the sentence-transformers model only when needed"""
+    global _model, _disabled
+    if _disabled:
+        return None
+    if _model is None:
+        with _model_lock:
+            if _model is None and not _disabled:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                    logger.info("Loading embedding model: %s", EMBEDDING_MODEL)
+                    _model = SentenceTransformer(EMBEDDING_MODEL)
+                except Exception as e:
+                    # Missing optional deps shouldn't take the API down;
+                    # just fall through to calling the LLM every time.
+                    logger.warning("Semantic cache disabled (%s)", str(e))
+                    _disabled = True
+    return _model
+
+
+class SemanticCache:
+    """Cosine-similarity cache over prompts, one instance per endpoint.
+
+    Embeddings are L2-normalized and stored in a FAISS inner-product index,
+    so the inner product is the cosine similarity. Responses live in a
+    parallel list; both are persisted to disk so the cache survives restarts.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.index = None
+        self.entries = []  # parallel list of {"prompt": ..., "response": ...}
+        self.lock = threading.Lock()
+        self.index_path = os.path.join(CACHE_DIR, f"{name}.faiss")
+        self.entries_path = os.path.join(CACHE_DIR, f"{name}.json")
+        self._loaded = False
+        self._flush_timer = None
+        self.hits = 0
+        self.misses = 0
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return self.index is not None
+        with self.lock:
+            if self._loaded:
+                return self.index is not None
+            self._loaded = True
+            model = _get_model()
+            if model is None:
+                return False
+            try:
+                import faiss
+                if os.path.exists(self.index_path) and os.path.exists(self.entries_path):
+                    self.index = faiss.read_index(self.index_path)
+                    with open(self.entries_path, "r", encoding="utf-8") as f:
+                        self.entries = json.load(f)
+                    logger.info("Loaded semantic cache '%s' with %d entries", self.name, len(self.entries))
+                else:
+                    dim = model.get_sentence_embedding_dimension()
+                    self.index = faiss.IndexFlatIP(dim)
+            except Exception as e:
+                logger.warning("Semantic cache '%s' disabled (%s)", self.name, str(e))
+                self.index = None
+            return self.index is not None
+
+    def _embed(self, prompt):
+        model = _get_model()
+        return model.encode([prompt], normalize_embeddings=True)
+
+    def lookup(self, prompt):
+        """Return the cached response for a similar prompt, or None on miss"""
+        if not self._ensure_loaded():
+            return None
+        try:
+            # Embed outside the lock (it's the expensive part), but search
+            # under it: FAISS indexes don't allow a search concurrent with
+            # an add, and the entries list must match the index it's read
+            # against
+            emb = self._embed(prompt)
+            with self.lock:
+                if self.index.ntotal > 0:
+                    D, I = self.index.search(emb, 1)
+                    if D[0][0] > SIMILARITY_THRESHOLD:
+                        self.hits += 1
+                        logger.info("Semantic cache hit on '%s' (similarity %.3f)", self.name, D[0][0])
+                        return self.entries[int(I[0][0])]["response"]
+                self.misses += 1
+                return None
+        except Exception as e:
+            logger.warning("Semantic cache lookup failed: %s", str(e))
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def store(self, prompt, response):
+        """Add a prompt/response pair and schedule a background flush"""
+        if not self._ensure_loaded():
+            return
+        try:
+            emb = self._embed(prompt)
+            with self.lock:
+                self.index.add(emb)
+                self.entries.append({"prompt": prompt, "response": response})
+                # Rewriting the whole index per store would serialize disk
+                # I/O into the request path; coalesce a burst of stores
+                # into one write a few seconds later
+                if self._flush_timer is None:
+                    self._flush_timer = threading.Timer(PERSIST_DELAY, self._flush)
+                    self._flush_timer.daemon = True
+                    self._flush_timer.start()
+        except Exception as e:
+            logger.warning("Semantic cache store failed: %s", str(e))
+
+    def _flush(self):
+        """Persist the index and entries; runs on the timer thread"""
+        try:
+            import faiss
+            with self.lock:
+                self._flush_timer = None
+                os.makedirs(CACHE_DIR, exist_ok=True)
+                faiss.write_index(self.index, self.index_path)
+                with open(self.entries_path, "w", encoding="utf-8") as f:
+                    json.dump(self.entries, f)
+        except Exception as e:
+            logger.warning("Semantic cache flush failed: %s", str(e))
+
+    def stats(self):
+        """Size and hit/miss counters for the /cache_stats endpoint"""
+        return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+
+# One cache per endpoint so generated code and improved prompts never mix
+generate_cache = SemanticCache("generate")
+improve_cache = SemanticCache("improve_prompt")
+
+
+def warm():
+    """Load the embedding model and indexes up front.
+
+    Called at import time under gunicorn preload_app so the model's
+    memory is shared copy-on-write across forked workers instead of
+    being loaded once per worker."""
+    generate_cache._ensure_loaded()
+    improve_cache._ensure_loaded()
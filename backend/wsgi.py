@@ -0,0 +1,10 @@
+import os
+
+# gunicorn entry point. When running gevent workers the sockets must be
+# monkey-patched before anything imports ssl/socket, so the patch has to
+# happen here, ahead of the app import.
+if os.getenv("GUNICORN_WORKER_CLASS", "gthread") == "gevent":
+    from gevent import monkey
+    monkey.patch_all()
+
+from app import app  # noqa: E402,F401
@@ -1,5 +1,13 @@
 from manim import *
 import numpy as np
+import os
+
+# Draft mode for iteration: DRAFT=1 renders at 854x480/15fps, cutting
+# pixels x frames by ~16x versus the default quality
+if os.environ.get("DRAFT", "0") == "1":
+    config.pixel_width = 854
+    config.pixel_height = 480
+    config.frame_rate = 15
 
 class DifferentiationAnimation(Scene):
     def construct(self):
@@ -16,11 +24,15 @@ class DifferentiationAnimation(Scene):
         )
         x_labels = [-2, -1, 0, 1, 2]
         y_labels = [-4, -2, 0, 2, 4]
+        # Compile all ten labels in one LaTeX run; a Tex per label spawns
+        # a separate pdflatex subprocess, the dominant cost of building
+        # this scene
+        label_tex = MathTex(*[str(v) for v in (*x_labels, *y_labels)], color=LIGHT_GRAY)
         coordinate_labels = VGroup()
-        for x in x_labels:
-            coordinate_labels.add(axes.get_x_axis_label(Tex(str(x), color=LIGHT_GRAY).scale(0.7), x))
-        for y in y_labels:
-            coordinate_labels.add(axes.get_y_axis_label(Tex(str(y), color=LIGHT_GRAY).scale(0.7), y))
+        for tex, x in zip(label_tex[: len(x_labels)], x_labels):
+            coordinate_labels.add(axes.get_x_axis_label(tex.scale(0.7), x))
+        for tex, y in zip(label_tex[len(x_labels):], y_labels):
+            coordinate_labels.add(axes.get_y_axis_label(tex.scale(0.7), y))
 
         # Plot the function
         def func(x):
@@ -42,31 +54,35 @@ class DifferentiationAnimation(Scene):
 
         dot.add_updater(lambda m: m.move_to(get_point_at_x(x_tracker.get_value())))
 
-        def get_tangent_line():
+        # One persistent tangent line mutated in place each frame;
+        # always_redraw would build and discard a fresh Line on every one
+        # of the ~540 frames of the sweep
+        tangent_line = Line(ORIGIN, RIGHT, color=YELLOW, stroke_width=3)
+
+        def update_tangent_line(line):
             x = x_tracker.get_value()
             slope = 3 * x**2 - 1
-            line = Line(
-                start=get_point_at_x(x) - np.array([1, slope, 0]),
-                end=get_point_at_x(x) + np.array([1, slope, 0]),
-                color=YELLOW,
-                stroke_width=3,
-            )
-            return line
+            point = get_point_at_x(x)
+            offset = np.array([1, slope, 0])
+            line.put_start_and_end_on(point - offset, point + offset)
 
-        tangent_line = always_redraw(get_tangent_line)
+        update_tangent_line(tangent_line)
+        tangent_line.add_updater(update_tangent_line)
 
         # Create derivative value display
         def get_derivative_value():
             x = x_tracker.get_value()
             return 3 * x**2 - 1
 
-        derivative_value = always_redraw(
-            lambda: DecimalNumber(
-                get_derivative_value(), color=GREEN, num_decimal_places=2
-            )
+        # A single DecimalNumber updated via set_value only retouches the
+        # digit glyphs that changed; always_redraw would re-tessellate a
+        # whole new number every frame
+        derivative_value = (
+            DecimalNumber(get_derivative_value(), color=GREEN, num_decimal_places=2)
             .scale(0.9)
             .next_to(derivative_formula, DOWN, buff=0.2)
         )
+        derivative_value.add_updater(lambda m: m.set_value(get_derivative_value()))
 
         # Animation sequence
         self.play(Create(axes), Write(coordinate_labels))
@@ -80,5 +96,24 @@ class DifferentiationAnimation(Scene):
 
 
 if __name__ == "__main__":
+    import subprocess
+
+    # Opt-in hardware video encoding (e.g. MANIM_VIDEO_CODEC=h264_nvenc or
+    # h264_amf): swaps Manim's libx264 software encode in the ffmpeg
+    # command for the GPU's fixed-function encoder
+    video_codec = os.environ.get("MANIM_VIDEO_CODEC", "")
+    _popen = subprocess.Popen
+
+    def _tuned_popen(args, *pargs, **kwargs):
+        if isinstance(args, (list, tuple)) and "ffmpeg" in str(args[0]):
+            # A 1 MB stdin buffer turns hundreds of per-frame pipe writes
+            # into a handful of large ones
+            kwargs.setdefault("bufsize", 1 << 20)
+            if video_codec and "libx264" in args:
+                args = [video_codec if a == "libx264" else a for a in args]
+        return _popen(args, *pargs, **kwargs)
+
+    subprocess.Popen = _tuned_popen
+
     scene = DifferentiationAnimation()
     scene.render()
\ No newline at end of file